@@ -1,8 +1,18 @@
 import streamlit as st
 from io import BytesIO
 import os
+import re
+import zipfile
 
 # Check for necessary libraries
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF < 1.24.3
+    except ImportError:
+        fitz = None
+
 try:
     from PyPDF2 import PdfReader
 except ImportError:
@@ -10,9 +20,23 @@ except ImportError:
 
 try:
     import docx
+    from docx.oxml.ns import qn
+    from lxml import etree
 except ImportError:
     docx = None
 
+try:
+    # Private python-docx module, only needed for the fast-download save
+    from docx.opc.pkgwriter import PackageWriter
+except ImportError:
+    PackageWriter = None
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
 # --- Page config ---
 st.set_page_config(page_title="📄 File Dashboard", page_icon="📂", layout="wide")
 
@@ -47,141 +71,292 @@ st.markdown(
 )
 
 # --- Helper functions ---
-def allowed_filetype(filename):
-    return filename.lower().endswith((".pdf", ".docx"))
+_PDF = ".pdf"
+_DOCX = ".docx"
+ALLOWED_EXTENSIONS = frozenset((_PDF, _DOCX))
+
+def allowed_filetype(ext):
+    return ext in ALLOWED_EXTENSIONS
+
+NUMBA_MIN_CHARS = 1_000_000
+
+if njit is not None:
+    @njit(cache=True)
+    def _normalize_bytes(buf):
+        # Single pass: drop spaces/tabs/CR before each newline and keep at
+        # most two consecutive newlines (one blank line between paragraphs)
+        out = np.empty_like(buf)
+        n = 0
+        newlines = 0
+        for c in buf:
+            if c == 10:
+                while n > 0 and (out[n - 1] == 32 or out[n - 1] == 9 or out[n - 1] == 13):
+                    n -= 1
+                if newlines < 2:
+                    out[n] = c
+                    n += 1
+                newlines += 1
+            else:
+                if c != 32 and c != 9 and c != 13:
+                    newlines = 0
+                out[n] = c
+                n += 1
+        return out[:n]
+
+def normalize_text(text):
+    if njit is not None and len(text) >= NUMBA_MIN_CHARS:
+        buf = np.frombuffer(text.encode("utf-8"), np.uint8)
+        return _normalize_bytes(buf).tobytes().decode("utf-8")
+    text = re.sub(r"[ \t\r]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text)
 
+@st.cache_data(max_entries=8, show_spinner=False)
 def extract_pdf_text(data):
+    if fitz is not None:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return "\n\n".join(page.get_text("text") for page in doc).strip()
     if PdfReader is None:
-        st.error("PyPDF2 not installed.")
+        st.error("PyMuPDF or PyPDF2 not installed.")
         return ""
     reader = PdfReader(BytesIO(data))
-    texts = [p.extract_text() or "" for p in reader.pages]
-    return "\n\n".join(texts).strip()
+    return "\n\n".join(p.extract_text() or "" for p in reader.pages).strip()
 
+@st.cache_data(max_entries=8, show_spinner=False)
 def extract_docx_text(data):
     if docx is None:
         st.error("python-docx not installed.")
         return ""
     document = docx.Document(BytesIO(data))
-    return "\n\n".join([p.text for p in document.paragraphs if p.text]).strip()
+    # Walk the body's <w:p> children in lxml directly instead of building
+    # Paragraph wrappers, rendering run content the way python-docx's
+    # Paragraph.text does (line breaks only for text-wrapping <w:br>)
+    w_p, w_t, w_br = qn("w:p"), qn("w:t"), qn("w:br")
+    w_type = qn("w:type")
+    fixed = {
+        qn("w:tab"): "\t",
+        qn("w:ptab"): "\t",
+        qn("w:cr"): "\n",
+        qn("w:noBreakHyphen"): "-",
+    }
+
+    def paragraph_text(p):
+        parts = []
+        for r in p.xpath("./w:r | ./w:hyperlink/w:r"):
+            for child in r.iterchildren():
+                tag = child.tag
+                if tag == w_t:
+                    parts.append(child.text or "")
+                elif tag in fixed:
+                    parts.append(fixed[tag])
+                elif tag == w_br and child.get(w_type, "textWrapping") == "textWrapping":
+                    parts.append("\n")
+        return "".join(parts)
+
+    paragraphs = (paragraph_text(p) for p in document.element.body.iterchildren(w_p))
+    return "\n\n".join(txt for txt in paragraphs if txt).strip()
+
+class _FastZipPkgWriter:
+    """Stand-in for python-docx's zip writer using DEFLATE level 1."""
 
-def create_docx_bytes_from_text(text):
+    def __init__(self, pkg_file):
+        self._zipf = zipfile.ZipFile(pkg_file, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def write(self, pack_uri, blob):
+        self._zipf.writestr(pack_uri.membername, blob)
+
+    def close(self):
+        self._zipf.close()
+
+_PKG_WRITER_HOOKS = ("_write_content_types_stream", "_write_pkg_rels", "_write_parts")
+
+def save_docx_fast(document, stream):
+    # Mirrors OpcPackage.save, swapping in the low-compression zip writer.
+    # These PackageWriter helpers are private; if a python-docx release
+    # moves or renames them, fall back to the regular save.
+    if PackageWriter is None or not all(hasattr(PackageWriter, name) for name in _PKG_WRITER_HOOKS):
+        document.save(stream)
+        return
+    package = document.part.package
+    for part in package.parts:
+        part.before_marshal()
+    writer = _FastZipPkgWriter(stream)
+    PackageWriter._write_content_types_stream(writer, package.parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, package.parts)
+    writer.close()
+
+# cache_resource hands back the same immutable bytes object on every hit
+# instead of unpickling a fresh copy as cache_data would
+@st.cache_resource(max_entries=8, show_spinner=False)
+def create_docx_bytes_from_text(text, fast=False):
     document = docx.Document()
-    for line in text.split("\n"):
-        document.add_paragraph(line)
+    # Build <w:p><w:r><w:t> directly in lxml, skipping Paragraph/Run wrappers
+    body = document.element.body
+    sect_pr = body.find(qn("w:sectPr"))
+    w_p, w_r, w_t, w_br = qn("w:p"), qn("w:r"), qn("w:t"), qn("w:br")
+    xml_space = qn("xml:space")
+    # One paragraph per blank-line-separated block; single newlines inside a
+    # block become <w:br/> line breaks within the same run
+    for block in text.split("\n\n"):
+        r = etree.SubElement(etree.SubElement(body, w_p), w_r)
+        for i, line in enumerate(block.split("\n")):
+            if i:
+                etree.SubElement(r, w_br)
+            t = etree.SubElement(r, w_t)
+            t.text = line
+            t.set(xml_space, "preserve")
+    if sect_pr is not None:
+        # Section properties must remain the last child of <w:body>
+        body.append(sect_pr)
     bio = BytesIO()
-    document.save(bio)
-    bio.seek(0)
-    return bio.read()
+    if fast:
+        save_docx_fast(document, bio)
+    else:
+        document.save(bio)
+    return bio.getvalue()
+
+def get_docx_bytes(text):
+    # Reuse the last generated DOCX while the content is unchanged
+    key = (hash(text), fast_download)
+    if st.session_state.get("docx_key") != key:
+        st.session_state.docx_bytes = create_docx_bytes_from_text(text, fast=fast_download)
+        st.session_state.docx_key = key
+    return st.session_state.docx_bytes
 
 # --- Sidebar options ---
 st.sidebar.header("💡 Options")
 show_preview = st.sidebar.checkbox("Show Full Preview", value=False)
 download_txt = st.sidebar.checkbox("Offer download as .txt", value=True)
 download_docx = st.sidebar.checkbox("Offer download as .docx", value=True)
+fast_download = st.sidebar.checkbox("Fast download (larger file)", value=False)
+
+# --- Operations UI ---
+# Runs as a fragment so interacting with these widgets reruns only this block
+@st.fragment
+def process_docx_ui(text, filename):
+    operation = st.selectbox("Select Operation", ("Read", "Write", "Append"))
+
+    user_text = st.text_area("Enter text for Write / Append", height=200)
+
+    if st.button("🚀 Process"):
+        if operation == "Read":
+            st.subheader("📄 Word Content Preview")
+            if show_preview:
+                st.text_area("Preview", text, height=400)
+            else:
+                st.text_area("Preview", st.session_state.preview, height=400)
+            # Download options
+            if download_txt:
+                # Encode the extracted text once per upload
+                if "utf8" not in st.session_state:
+                    st.session_state.utf8 = text.encode("utf-8")
+                st.download_button(
+                    "💾 Download as .txt",
+                    data=st.session_state.utf8,
+                    file_name=f"{os.path.splitext(filename)[0]}_read.txt",
+                    mime="text/plain"
+                )
+            if download_docx and docx is not None:
+                st.download_button(
+                    "💾 Download as .docx",
+                    data=get_docx_bytes(text),
+                    file_name=f"{os.path.splitext(filename)[0]}_read.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                )
+        elif operation == "Write":
+            if not user_text.strip():
+                st.error("Write operation requires non-empty text.")
+            else:
+                new_content = user_text.strip()
+                st.success("Write content ready for download 💾")
+                if download_txt:
+                    st.download_button(
+                        "Download Written as .txt",
+                        data=new_content.encode("utf-8"),
+                        file_name=f"{os.path.splitext(filename)[0]}_written.txt",
+                        mime="text/plain"
+                    )
+                if download_docx and docx is not None:
+                    st.download_button(
+                        "Download Written as .docx",
+                        data=get_docx_bytes(new_content),
+                        file_name=f"{os.path.splitext(filename)[0]}_written.docx",
+                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                    )
+        elif operation == "Append":
+            if not user_text.strip():
+                st.error("Append operation requires non-empty text.")
+            else:
+                new_content = text + "\n\n" + user_text.strip()
+                st.success("Append content ready for download 💾")
+                if download_txt:
+                    st.download_button(
+                        "Download Appended as .txt",
+                        data=new_content.encode("utf-8"),
+                        file_name=f"{os.path.splitext(filename)[0]}_appended.txt",
+                        mime="text/plain"
+                    )
+                if download_docx and docx is not None:
+                    st.download_button(
+                        "Download Appended as .docx",
+                        data=get_docx_bytes(new_content),
+                        file_name=f"{os.path.splitext(filename)[0]}_appended.docx",
+                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                    )
 
 # --- File upload ---
 uploaded_file = st.file_uploader("Upload your file (PDF or DOCX)", type=["pdf", "docx"])
 
 if uploaded_file:
     filename = uploaded_file.name
-    raw = uploaded_file.read()
     
-    is_pdf = filename.lower().endswith(".pdf")
-    is_docx = filename.lower().endswith(".docx")
+    ext = os.path.splitext(filename)[1].lower()
+    is_pdf = ext == _PDF
+    is_docx = ext == _DOCX
     
-    if not allowed_filetype(filename):
+    # Validate before touching the upload bytes
+    if not allowed_filetype(ext):
         st.error("Only PDF and Word files are accepted.")
-    else:
-        # --- PDF Section ---
+        st.stop()
+    
+    # Parse once per upload, not once per widget-triggered rerun
+    if st.session_state.get("file_id") != uploaded_file.file_id:
+        # getvalue() shares Streamlit's upload buffer instead of copying it
         if is_pdf:
-            st.info("PDF detected: Only Read and Convert to Word are available 📖")
-            text = extract_pdf_text(raw)
-            st.subheader("📄 PDF Content Preview")
-            if text:
-                if show_preview:
-                    st.text_area("Preview", text, height=400)
-                else:
-                    st.text_area("Preview", text[:2000] + ("\n\n... (truncated)" if len(text)>2000 else ""), height=400)
-                # Convert PDF to Word
-                if st.button("📝 Convert PDF to Word"):
-                    docx_bytes = create_docx_bytes_from_text(text)
-                    st.download_button(
-                        "💾 Download Word File",
-                        data=docx_bytes,
-                        file_name=f"{os.path.splitext(filename)[0]}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
+            text = normalize_text(extract_pdf_text(uploaded_file.getvalue()))
+        else:
+            text = extract_docx_text(uploaded_file.getvalue())
+        preview = text if len(text) <= 2000 else text[:2000] + "\n\n... (truncated)"
+        # Record the upload only once extraction has succeeded, so a parse
+        # error is retried on the next rerun instead of showing stale text
+        st.session_state.pop("utf8", None)
+        st.session_state.text = text
+        st.session_state.preview = preview
+        st.session_state.file_id = uploaded_file.file_id
+    text = st.session_state.text
+    
+    # --- PDF Section ---
+    if is_pdf:
+        st.info("PDF detected: Only Read and Convert to Word are available 📖")
+        st.subheader("📄 PDF Content Preview")
+        if text:
+            if show_preview:
+                st.text_area("Preview", text, height=400)
             else:
-                st.warning("No extractable text found in PDF.")
-
-        # --- DOCX Section ---
-        elif is_docx:
-            st.success("Word file detected: Read / Write / Append enabled ✨")
-            operation = st.selectbox("Select Operation", ("Read", "Write", "Append"))
-            text = extract_docx_text(raw)
-            
-            user_text = st.text_area("Enter text for Write / Append", height=200)
-            
-            if st.button("🚀 Process"):
-                if operation == "Read":
-                    st.subheader("📄 Word Content Preview")
-                    if show_preview:
-                        st.text_area("Preview", text, height=400)
-                    else:
-                        st.text_area("Preview", text[:2000] + ("\n\n... (truncated)" if len(text)>2000 else ""), height=400)
-                    # Download options
-                    if download_txt:
-                        st.download_button(
-                            "💾 Download as .txt",
-                            data=text.encode("utf-8"),
-                            file_name=f"{os.path.splitext(filename)[0]}_read.txt",
-                            mime="text/plain"
-                        )
-                    if download_docx and docx is not None:
-                        st.download_button(
-                            "💾 Download as .docx",
-                            data=create_docx_bytes_from_text(text),
-                            file_name=f"{os.path.splitext(filename)[0]}_read.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
-                elif operation == "Write":
-                    if not user_text.strip():
-                        st.error("Write operation requires non-empty text.")
-                    else:
-                        new_content = user_text.strip()
-                        st.success("Write content ready for download 💾")
-                        if download_txt:
-                            st.download_button(
-                                "Download Written as .txt",
-                                data=new_content.encode("utf-8"),
-                                file_name=f"{os.path.splitext(filename)[0]}_written.txt",
-                                mime="text/plain"
-                            )
-                        if download_docx and docx is not None:
-                            st.download_button(
-                                "Download Written as .docx",
-                                data=create_docx_bytes_from_text(new_content),
-                                file_name=f"{os.path.splitext(filename)[0]}_written.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            )
-                elif operation == "Append":
-                    if not user_text.strip():
-                        st.error("Append operation requires non-empty text.")
-                    else:
-                        new_content = text + "\n\n" + user_text.strip()
-                        st.success("Append content ready for download 💾")
-                        if download_txt:
-                            st.download_button(
-                                "Download Appended as .txt",
-                                data=new_content.encode("utf-8"),
-                                file_name=f"{os.path.splitext(filename)[0]}_appended.txt",
-                                mime="text/plain"
-                            )
-                        if download_docx and docx is not None:
-                            st.download_button(
-                                "Download Appended as .docx",
-                                data=create_docx_bytes_from_text(new_content),
-                                file_name=f"{os.path.splitext(filename)[0]}_appended.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            )
+                st.text_area("Preview", st.session_state.preview, height=400)
+            # Convert PDF to Word
+            if st.button("📝 Convert PDF to Word"):
+                docx_bytes = get_docx_bytes(text)
+                st.download_button(
+                    "💾 Download Word File",
+                    data=docx_bytes,
+                    file_name=f"{os.path.splitext(filename)[0]}.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                )
+        else:
+            st.warning("No extractable text found in PDF.")
+
+    # --- DOCX Section ---
+    elif is_docx:
+        st.success("Word file detected: Read / Write / Append enabled ✨")
+        process_docx_ui(text, filename)